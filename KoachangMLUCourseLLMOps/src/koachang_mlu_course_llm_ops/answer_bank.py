@@ -0,0 +1,132 @@
+import hashlib
+import json
+import mmap
+import re
+import struct
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+# File layout, all integers little-endian:
+#   header:  magic (8 bytes) | fingerprint (32 bytes) | entry count N (uint64)
+#   hashes:  N sorted uint64 hashes of the normalized questions
+#   offsets: N + 1 uint64 offsets of the records, relative to the start of the records
+#   records: N UTF-8 JSON objects with `question`, `answer` and `relevant_links`
+MAGIC = b"ANSBANK1"
+_HEADER = struct.Struct("<8s32sQ")
+_UINT64 = struct.Struct("<Q")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Normalize the Unicode form, case, whitespace and final punctuation of a question."""
+    normalized = unicodedata.normalize("NFKC", question).lower()
+    return _WHITESPACE.sub(" ", normalized).strip().rstrip("?!. ")
+
+
+def fingerprint(*parts: str) -> bytes:
+    """Identify the inputs answers were generated from, such as the corpus version and prompt."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).digest()
+
+
+def _hash(normalized_question: str) -> int:
+    digest = hashlib.blake2b(normalized_question.encode("utf-8"), digest_size=8).digest()
+    return _UINT64.unpack(digest)[0]
+
+
+def mine_frequent_questions(
+    questions: Iterable[str], top: int, min_count: int
+) -> List[Tuple[str, int]]:
+    """Return up to `top` questions asked at least `min_count` times, most frequent first.
+
+    Questions are grouped by their normalized form and represented by their most common wording.
+    """
+    counts: Counter = Counter()
+    wordings: defaultdict = defaultdict(Counter)
+    for question in questions:
+        normalized = normalize_question(question)
+        if normalized:
+            counts[normalized] += 1
+            wordings[normalized][question.strip()] += 1
+    return [
+        (wordings[normalized].most_common(1)[0][0], count)
+        for normalized, count in counts.most_common(top)
+        if count >= min_count
+    ]
+
+
+def write_answer_bank(
+    path: str, bank_fingerprint: bytes, entries: Iterable[Tuple[str, str, List[str]]]
+) -> int:
+    """Write (question, answer, relevant_links) entries to `path` and return the number written."""
+    records = {}
+    for question, answer, relevant_links in entries:
+        normalized = normalize_question(question)
+        records[_hash(normalized)] = json.dumps(
+            {"question": normalized, "answer": answer, "relevant_links": sorted(relevant_links)},
+            sort_keys=True,
+        ).encode("utf-8")
+
+    hashes = sorted(records)
+    offsets = [0]
+    for question_hash in hashes:
+        offsets.append(offsets[-1] + len(records[question_hash]))
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, bank_fingerprint, len(hashes)))
+        f.write(struct.pack(f"<{len(hashes)}Q", *hashes))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for question_hash in hashes:
+            f.write(records[question_hash])
+    return len(hashes)
+
+
+class AnswerBank:
+    """Read-only, memory-mapped lookup of precomputed answers by normalized question."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < _HEADER.size or self._data[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an answer bank")
+        _, self.fingerprint, self._count = _HEADER.unpack_from(self._data, 0)
+        self._hashes_start = _HEADER.size
+        self._offsets_start = self._hashes_start + self._count * _UINT64.size
+        self._records_start = self._offsets_start + (self._count + 1) * _UINT64.size
+        if (
+            len(self._data) < self._records_start
+            or len(self._data) != self._records_start + self._offset_at(self._count)
+        ):
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _hash_at(self, index: int) -> int:
+        return _UINT64.unpack_from(self._data, self._hashes_start + index * _UINT64.size)[0]
+
+    def _offset_at(self, index: int) -> int:
+        return _UINT64.unpack_from(self._data, self._offsets_start + index * _UINT64.size)[0]
+
+    def lookup(self, question: str) -> Optional[dict]:
+        """Return the stored `answer` and `relevant_links` for `question`, or None if not banked."""
+        normalized = normalize_question(question)
+        target = _hash(normalized)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._hash_at(low) != target:
+            return None
+
+        start = self._records_start + self._offset_at(low)
+        end = self._records_start + self._offset_at(low + 1)
+        record = json.loads(self._data[start:end])
+        # Guard against hash collisions: only exact matches of the normalized question are served.
+        if record["question"] != normalized:
+            return None
+        return {"answer": record["answer"], "relevant_links": record["relevant_links"]}
@@ -0,0 +1,128 @@
+import json
+import math
+import random
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_NUM_BUCKETS = 2**18
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _features(text: str, num_buckets: int) -> List[int]:
+    """Hash word unigrams, word bigrams and character trigrams of `text` into bucket indexes."""
+    normalized = text.lower()
+    words = _TOKEN_PATTERN.findall(normalized)
+    grams = [f"w:{word}" for word in words]
+    grams += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+    padded = f" {' '.join(words)} "
+    grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    # crc32 is stable across processes, unlike hash(), so offline weights stay valid in Lambda.
+    return [zlib.crc32(gram.encode("utf-8")) % num_buckets for gram in grams]
+
+
+def _sigmoid(value: float) -> float:
+    if value < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+class HashedNgramClassifier:
+    """Logistic regression over hashed n-grams that scores how likely a question is off-topic."""
+
+    def __init__(
+        self,
+        weights: Optional[Dict[int, float]] = None,
+        bias: float = 0.0,
+        num_buckets: int = DEFAULT_NUM_BUCKETS,
+    ) -> None:
+        self.weights = weights or {}
+        self.bias = bias
+        self.num_buckets = num_buckets
+
+    def predict(self, text: str) -> float:
+        """Return the probability that `text` is off-topic."""
+        weights = self.weights
+        score = self.bias + sum(
+            weights.get(bucket, 0.0) for bucket in _features(text, self.num_buckets)
+        )
+        return _sigmoid(score)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "num_buckets": self.num_buckets,
+                    "bias": self.bias,
+                    "weights": {str(bucket): weight for bucket, weight in self.weights.items()},
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramClassifier":
+        with open(path, encoding="utf-8") as f:
+            model = json.load(f)
+        return cls(
+            weights={int(bucket): weight for bucket, weight in model["weights"].items()},
+            bias=model["bias"],
+            num_buckets=model["num_buckets"],
+        )
+
+
+def train(
+    examples: Sequence[Tuple[str, bool]],
+    epochs: int = 10,
+    learning_rate: float = 0.1,
+    l2: float = 1e-6,
+    num_buckets: int = DEFAULT_NUM_BUCKETS,
+    seed: int = 0,
+) -> HashedNgramClassifier:
+    """Fit the classifier with SGD on (question, is_off_topic) examples from logged traffic."""
+    rng = random.Random(seed)
+    featurized = [(_features(text, num_buckets), 1.0 if label else 0.0) for text, label in examples]
+    weights: Dict[int, float] = {}
+    bias = 0.0
+    for _ in range(epochs):
+        rng.shuffle(featurized)
+        for buckets, label in featurized:
+            prediction = _sigmoid(bias + sum(weights.get(bucket, 0.0) for bucket in buckets))
+            gradient = prediction - label
+            bias -= learning_rate * gradient
+            for bucket in buckets:
+                weight = weights.get(bucket, 0.0)
+                weights[bucket] = weight - learning_rate * (gradient + l2 * weight)
+
+    # Dropping near-zero weights keeps the artifact small enough to load on every cold start.
+    weights = {bucket: weight for bucket, weight in weights.items() if abs(weight) > 1e-4}
+    return HashedNgramClassifier(weights, bias, num_buckets)
+
+
+def load_examples(path: str) -> List[Tuple[str, bool]]:
+    """Read logged questions from a JSON Lines file with `question` and `off_topic` fields."""
+    with open(path, encoding="utf-8") as f:
+        return [
+            (record["question"], bool(record["off_topic"]))
+            for record in map(json.loads, filter(str.strip, f))
+        ]
+
+
+def evaluate(
+    classifier: HashedNgramClassifier, examples: Iterable[Tuple[str, bool]], threshold: float
+) -> Dict[str, float]:
+    """Report how often the classifier would reject questions at `threshold`.
+
+    `rejected_on_topic` is the share of on-topic questions that would wrongly get the canned
+    response; `rejected_off_topic` is the share of off-topic questions that would skip the full
+    chain, i.e. the fraction of off-topic traffic whose guardrail, Kendra and Bedrock costs are
+    saved.
+    """
+    counts = {True: [0, 0], False: [0, 0]}
+    for text, label in examples:
+        counts[label][0] += 1
+        counts[label][1] += classifier.predict(text) >= threshold
+    return {
+        "rejected_off_topic": counts[True][1] / max(counts[True][0], 1),
+        "rejected_on_topic": counts[False][1] / max(counts[False][0], 1),
+    }
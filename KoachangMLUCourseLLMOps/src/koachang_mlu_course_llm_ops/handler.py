@@ -11,8 +11,17 @@ from langchain_aws import ChatBedrock
 from langchain_community.callbacks.manager import get_bedrock_anthropic_callback
 from langchain.output_parsers.regex import RegexParser
 from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain.tools import tool
 
+from koachang_mlu_course_llm_ops import answer_bank, retrieval
+from koachang_mlu_course_llm_ops.classifier import HashedNgramClassifier
+from koachang_mlu_course_llm_ops.session import (
+    Conversation,
+    DynamoDBSessionStore,
+    InMemorySessionStore,
+)
+
 
 app = APIGatewayRestResolver()
 logger = Logger(service="KoachangMLUCourseLLMOps")
@@ -22,11 +31,41 @@ KENDRA_INDEX_ID = os.environ["KENDRA_INDEX_ID"]
 GUARDRAIL_ID = os.environ["GUARDRAIL_ID"]
 GUARDRAIL_VERSION = os.environ["GUARDRAIL_VERSION"]
 AWS_REGION = os.environ["AWS_REGION"]
+RETRIEVAL_PAGE_SIZE = int(os.environ.get("RETRIEVAL_PAGE_SIZE", "5"))
+RETRIEVAL_SHARD_TIMEOUT_SECONDS = float(os.environ.get("RETRIEVAL_SHARD_TIMEOUT_SECONDS", "3"))
+# JSON list of shards to fan retrieval out to. See `retrieval.load_shards` for the format.
+RETRIEVAL_SHARDS = retrieval.load_shards(
+    os.environ.get("RETRIEVAL_SHARDS"), KENDRA_INDEX_ID, RETRIEVAL_PAGE_SIZE
+)
+# Off-topic pre-classifier trained offline with `invoke train-classifier`. The stage is skipped
+# when no model file is packaged.
+OFF_TOPIC_CLASSIFIER_PATH = os.environ.get(
+    "OFF_TOPIC_CLASSIFIER_PATH",
+    os.path.join(os.path.dirname(__file__), "off_topic_classifier.json"),
+)
+OFF_TOPIC_THRESHOLD = float(os.environ.get("OFF_TOPIC_THRESHOLD", "0.9"))
+OFF_TOPIC_ANSWER = "I don't know. I can only answer questions about AWS."
+# Sessions are kept in DynamoDB when a table is configured, and in memory otherwise.
+SESSION_TABLE_NAME = os.environ.get("SESSION_TABLE_NAME")
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "86400"))
+SESSION_RECENT_TURNS = max(1, int(os.environ.get("SESSION_RECENT_TURNS", "3")))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.environ.get("SESSION_HISTORY_TOKEN_BUDGET", "1000"))
+# Precomputed answers built offline with `invoke build-answer-bank`. The bank is only served when
+# it was generated from the deployed corpus version (RAG_VERSION), prompt, model and guardrail.
+ANSWER_BANK_PATH = os.environ.get(
+    "ANSWER_BANK_PATH", os.path.join(os.path.dirname(__file__), "answer_bank.bin")
+)
+RAG_VERSION = os.environ.get("RAG_VERSION")
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
 
-kendra = boto3.client("kendra", region_name=AWS_REGION)
+kendra = boto3.client(
+    "kendra",
+    region_name=AWS_REGION,
+    config=retrieval.client_config(RETRIEVAL_SHARDS, RETRIEVAL_SHARD_TIMEOUT_SECONDS),
+)
 bedrock_runtime = boto3.client("bedrock-runtime", region_name=AWS_REGION)
 llm_claude_haiku = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    model_id=MODEL_ID,
     client=bedrock_runtime,
     model_kwargs={
         "max_tokens": 500,
@@ -37,11 +76,21 @@ llm_claude_haiku = ChatBedrock(
     cache=False,
 )
 
+session_store = (
+    DynamoDBSessionStore(
+        boto3.client("dynamodb", region_name=AWS_REGION), SESSION_TABLE_NAME, SESSION_TTL_SECONDS
+    )
+    if SESSION_TABLE_NAME
+    else InMemorySessionStore()
+)
+
 prompt_enforce = PromptTemplate.from_template(
     """You act as a AWS Cloud Practitioner and only answer questions about AWS. Read the user's
 question supplied within the <question></question> tags. Then, use the contextual information provided
 above within the <context></context> tags to provide an answer. Do not repeat the context.
 Respond that you don't know if you don't have enough information to answer.
+If the conversation so far is supplied within the <history></history> tags, use it to understand the
+question.
 
 Return your output in <answer></answer> tags as in this example:
 
@@ -59,17 +108,146 @@ Example answer
 
 Below starts the real task:
 
-<context>
+{history}<context>
 {context}
 </context>
 
 <question>
 {question}
 </question>
-""")
+""",
+    # Single-shot requests have no history section.
+    partial_variables={"history": ""},
+)
 
 parser = RegexParser(regex=r"(?s)<answer>(.*)</answer>", output_keys=["answer"])
 
+ANSWER_BANK_FINGERPRINT = (
+    answer_bank.fingerprint(RAG_VERSION, prompt_enforce.template, MODEL_ID, GUARDRAIL_VERSION)
+    if RAG_VERSION
+    else None
+)
+
+
+def load_answer_bank() -> Optional[answer_bank.AnswerBank]:
+    if ANSWER_BANK_FINGERPRINT is None or not os.path.exists(ANSWER_BANK_PATH):
+        return None
+    try:
+        bank = answer_bank.AnswerBank(ANSWER_BANK_PATH)
+    except (OSError, ValueError) as e:
+        # A bad bank must not keep the function from starting: answer from the live chain instead.
+        logger.warning(f"Answer bank cannot be read and will not be served: {e}")
+        return None
+    if bank.fingerprint != ANSWER_BANK_FINGERPRINT:
+        logger.warning(
+            "Answer bank is stale and will not be served. Run `invoke build-answer-bank`.",
+            extra={
+                "answer_bank_fingerprint": bank.fingerprint.hex(),
+                "expected_fingerprint": ANSWER_BANK_FINGERPRINT.hex(),
+                "rag_version": RAG_VERSION,
+                "model_id": MODEL_ID,
+                "guardrail_version": GUARDRAIL_VERSION,
+            },
+        )
+        return None
+    return bank
+
+
+precomputed_answers = load_answer_bank()
+
+prompt_summarize = PromptTemplate.from_template(
+    """Below is the summary of a conversation between a user and an AWS Cloud Practitioner within
+the <summary></summary> tags, followed by the latest turns of the conversation within the
+<turns></turns> tags. Write a new summary of the whole conversation in at most 150 words. Keep the
+AWS services, resources and facts the user may refer to later. Return the new summary in
+<summary></summary> tags.
+
+<summary>
+{summary}
+</summary>
+
+<turns>
+{turns}
+</turns>
+""")
+
+prompt_rewrite = PromptTemplate.from_template(
+    """Below is a conversation between a user and an AWS Cloud Practitioner, followed by a follow-up
+question of the user within the <question></question> tags. Rewrite the follow-up question into a
+standalone question that can be understood without the conversation. Do not answer the question.
+Return the standalone question in <standalone_question></standalone_question> tags.
+
+{history}<question>
+{question}
+</question>
+""")
+
+
+def summarize_turns(summary: str, turns: list) -> str:
+    rendered_turns = "\n".join(
+        f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns
+    )
+    chain = prompt_summarize | llm_claude_haiku | RegexParser(
+        regex=r"(?s)<summary>(.*)</summary>", output_keys=["summary"]
+    )
+    return chain.invoke({"summary": summary, "turns": rendered_turns})["summary"].strip()
+
+
+def rewrite_question(history: str, question: str) -> str:
+    chain = prompt_rewrite | llm_claude_haiku | RegexParser(
+        regex=r"(?s)<standalone_question>(.*)</standalone_question>", output_keys=["question"]
+    )
+    return chain.invoke({"history": history, "question": question})["question"].strip()
+
+
+def load_conversation(session_id: str) -> Conversation:
+    return Conversation(
+        session_store.get(session_id),
+        recent_turns=SESSION_RECENT_TURNS,
+        token_budget=SESSION_HISTORY_TOKEN_BUDGET,
+        summarize=summarize_turns,
+        rewrite=rewrite_question,
+    )
+
+
+off_topic_classifier: Optional[HashedNgramClassifier] = (
+    HashedNgramClassifier.load(OFF_TOPIC_CLASSIFIER_PATH)
+    if os.path.exists(OFF_TOPIC_CLASSIFIER_PATH)
+    else None
+)
+
+
+class OffTopicQuestionError(Exception):
+    """Raised by the pre-classifier to short-circuit the chain for an off-topic question."""
+
+
+@tool(infer_schema=False)
+def pre_classifier(question: str) -> str:
+    """Reject clearly off-topic questions before paying for Kendra and the LLM. Runs after the input
+    guardrail, so that only guarded questions are logged. If the question is not rejected, forward
+    it to the next tool in chain.
+    """
+    if off_topic_classifier is None:
+        return question
+
+    probability = off_topic_classifier.predict(question)
+    rejected = probability >= OFF_TOPIC_THRESHOLD
+    # Logged with the question so that reviewed decisions can be exported as training data for
+    # `invoke train-classifier`.
+    logger.info(
+        "Pre-classifier decision",
+        extra={
+            "question": question,
+            "off_topic_probability": probability,
+            "off_topic_threshold": OFF_TOPIC_THRESHOLD,
+            "rejected": rejected,
+        },
+    )
+    if rejected:
+        raise OffTopicQuestionError(question)
+
+    return question
+
 
 @tool(infer_schema=False)
 def guardrail(content: str) -> str:
@@ -100,13 +278,12 @@ def guardrail(content: str) -> str:
 @tool
 def retrieve_context(query: str) -> dict:
     """Retrieve the list of documents from Kendra that are relevant to the query"""
-    response = kendra.retrieve(
-        IndexId=KENDRA_INDEX_ID,
-        QueryText=query,
-        PageNumber=1,
-        PageSize=5,
+    documents, failed_shards = retrieval.retrieve(
+        kendra, query, RETRIEVAL_SHARDS, RETRIEVAL_PAGE_SIZE, RETRIEVAL_SHARD_TIMEOUT_SECONDS
     )
-    documents = response["ResultItems"]
+    if failed_shards:
+        logger.warning(f"Retrieval shards failed or timed out: {', '.join(failed_shards)}")
+        metrics.add_metric(name="RetrievalShardFailures", unit="Count", value=len(failed_shards))
     document_ids = [document["DocumentId"] for document in documents]
     context = "\n".join([document["Content"] for document in documents])
     return {
@@ -130,26 +307,87 @@ def get_link_from_document_id(document_id: str) -> Optional[str]:
         path = match.group(1)
         return f"https://aws.amazon.com/blogs/compute/{path}/"
     
-def get_chain():
-    return guardrail | retrieve_context | prompt_enforce | llm_claude_haiku | parser | guardrail
+def log_question(question: str) -> str:
+    # Logged for mining frequent questions into the answer bank, only once the input guardrail let
+    # the question through so that blocked content, such as credentials, never reaches the logs.
+    logger.info("Question received", extra={"question": question})
+    return question
+
+
+def get_chain(conversation: Optional[Conversation] = None):
+    history = conversation.render_history() if conversation else ""
+    if conversation is None or not history:
+        chain = guardrail | RunnableLambda(log_question)
+        if off_topic_classifier is not None:
+            chain = chain | pre_classifier
+        return chain | retrieve_context | prompt_enforce | llm_claude_haiku | parser | guardrail
+
+    # Follow-up questions are guarded as asked, then rewritten into a standalone query so that the
+    # pre-classifier and retrieval do not depend on the conversation. The prompt only receives the
+    # bounded history rendered by the conversation.
+    chain = (
+        guardrail
+        | RunnableLambda(log_question)
+        | RunnableLambda(conversation.rewrite_question)
+    )
+    if off_topic_classifier is not None:
+        chain = chain | pre_classifier
+    return (
+        chain
+        | retrieve_context
+        | RunnableLambda(lambda inputs: {**inputs, "history": history})
+        | prompt_enforce
+        | llm_claude_haiku
+        | parser
+        | guardrail
+    )
 
 @app.post("/")
-def query_handler() -> str:
+def query_handler() -> dict:
     post_data: dict = app.current_event.json_body
     question = post_data.get("question")
     if not question:
         raise BadRequestError("Request must contain 'question' field")
 
+    session_id = post_data.get("session_id")
+    conversation = None
+    if session_id is not None:
+        if not isinstance(session_id, str) or not 0 < len(session_id) <= 128:
+            raise BadRequestError("'session_id' must be a string of 1 to 128 characters")
+        conversation = load_conversation(session_id)
+    session_fields = {"session_id": session_id} if conversation else {}
+
+    # Banked answers do not depend on a conversation, so only serve them to standalone questions.
+    banked = None
+    if precomputed_answers is not None and not (conversation and conversation.render_history()):
+        banked = precomputed_answers.lookup(question)
+    if banked is not None:
+        # Banked questions were guarded when the bank was built.
+        log_question(question)
+        metrics.add_metric(name="AnswerBankHits", unit="Count", value=1)
+        if conversation and session_id:
+            conversation.add_turn(question, banked["answer"])
+            session_store.put(session_id, conversation.to_state())
+        return {**banked, **session_fields}
+
     with get_bedrock_anthropic_callback() as cb:
-        answer = get_chain().invoke(question)
+        try:
+            answer = get_chain(conversation).invoke(question)
+        except OffTopicQuestionError:
+            metrics.add_metric(name="OffTopicRejections", unit="Count", value=1)
+            return {"answer": OFF_TOPIC_ANSWER, "relevant_links": [], **session_fields}
+        if conversation and session_id:
+            conversation.add_turn(question, answer.strip())
+            session_store.put(session_id, conversation.to_state())
         metrics.add_metric(name="InputTokens", unit="Count", value=cb.prompt_tokens)
         metrics.add_metric(name="OutputTokens", unit="Count", value=cb.completion_tokens)
         metrics.add_metric(name="TotalTokens", unit="Count", value=cb.total_tokens)
 
-    document_ids = retrieve_context(question)["document_ids"]
+    retrieval_query = (conversation and conversation.standalone_question) or question
+    document_ids = retrieve_context(retrieval_query)["document_ids"]
     relevant_links = set([get_link_from_document_id(doc_id) for doc_id in document_ids]) 
 
-    return {"answer": answer.strip(), "relevant_links": list(relevant_links)}
+    return {"answer": answer.strip(), "relevant_links": list(relevant_links), **session_fields}
 
 @metrics.log_metrics
 def lambda_handler(event: dict, context: LambdaContext) -> dict:
@@ -0,0 +1,145 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.config import Config
+
+# Kendra's Retrieve API does not return numeric relevance scores, only a confidence bucket. Map
+# the buckets onto [0, 1] so results from different shards can be compared.
+CONFIDENCE_SCORES = {
+    "VERY_HIGH": 1.0,
+    "HIGH": 0.75,
+    "MEDIUM": 0.5,
+    "LOW": 0.25,
+    "NOT_AVAILABLE": 0.25,
+}
+
+# Shared across invocations so a shard that times out keeps running in the background instead of
+# blocking the response until it returns. The Kendra client must bound its own calls, see
+# `client_config`, or hung shards hold workers long after their results are discarded.
+_executor = ThreadPoolExecutor(max_workers=8)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """A Kendra index, optionally narrowed by an attribute filter, to retrieve passages from."""
+
+    name: str
+    index_id: str
+    attribute_filter: Optional[Dict[str, Any]] = None
+    page_size: int = 5
+    # Number of merged results reserved for this shard when it returns enough passages.
+    quota: int = 0
+
+
+def load_shards(
+    config: Optional[str], default_index_id: str, default_page_size: int
+) -> List[Shard]:
+    """Build shards from a JSON list of objects with the fields of `Shard`.
+
+    `index_id` and `page_size` default to the service's index and page size. Without a
+    configuration, a single shard queries the whole default index.
+    """
+    if not config:
+        return [Shard(name="default", index_id=default_index_id, page_size=default_page_size)]
+
+    return [
+        Shard(
+            name=item["name"],
+            index_id=item.get("index_id", default_index_id),
+            attribute_filter=item.get("attribute_filter"),
+            page_size=item.get("page_size", default_page_size),
+            quota=item.get("quota", 0),
+        )
+        for item in json.loads(config)
+    ]
+
+
+def client_config(shards: List[Shard], timeout: float) -> Optional[Config]:
+    """Return the Kendra client configuration for fanning out to `shards`.
+
+    With several shards, each call is cut off after `timeout` seconds without retrying, since a
+    late answer is discarded anyway. A single shard keeps the client defaults.
+    """
+    if len(shards) <= 1:
+        return None
+    return Config(connect_timeout=timeout, read_timeout=timeout, retries={"total_max_attempts": 1})
+
+
+def _score(item: dict, rank: int, count: int) -> float:
+    confidence = item.get("ScoreAttributes", {}).get("ScoreConfidence", "NOT_AVAILABLE")
+    # The rank within the shard only breaks ties between passages of the same confidence.
+    return CONFIDENCE_SCORES.get(confidence, 0.0) + 0.1 * (1 - rank / count)
+
+
+def _retrieve_shard(kendra: Any, shard: Shard, query: str) -> List[Tuple[float, dict]]:
+    request: Dict[str, Any] = {
+        "IndexId": shard.index_id,
+        "QueryText": query,
+        "PageNumber": 1,
+        "PageSize": shard.page_size,
+    }
+    if shard.attribute_filter:
+        request["AttributeFilter"] = shard.attribute_filter
+    items = kendra.retrieve(**request)["ResultItems"]
+    return [(_score(item, rank, len(items)), item) for rank, item in enumerate(items)]
+
+
+def merge(results: List[Tuple[Shard, List[Tuple[float, dict]]]], page_size: int) -> List[dict]:
+    """Merge scored passages from several shards into at most `page_size` passages.
+
+    Each shard first gets up to its quota of its best passages, then the remaining slots go to the
+    best-scored passages across all shards. Passages with the same document ID and content are
+    kept once.
+    """
+    selected: Dict[Tuple[str, str], Tuple[float, dict]] = {}
+
+    def add(score: float, item: dict) -> None:
+        key = (item["DocumentId"], item["Content"])
+        if key not in selected and len(selected) < page_size:
+            selected[key] = (score, item)
+
+    ranked = [(shard, sorted(items, key=lambda x: x[0], reverse=True)) for shard, items in results]
+    for shard, items in ranked:
+        for score, item in items[: shard.quota]:
+            add(score, item)
+    for score, item in sorted(
+        (scored for _, items in ranked for scored in items), key=lambda x: x[0], reverse=True
+    ):
+        add(score, item)
+
+    return [item for _, item in sorted(selected.values(), key=lambda x: x[0], reverse=True)]
+
+
+def retrieve(
+    kendra: Any, query: str, shards: List[Shard], page_size: int, timeout: float
+) -> Tuple[List[dict], List[str]]:
+    """Query all shards in parallel and merge their passages.
+
+    Returns the merged passages and the names of the shards that failed or did not answer within
+    `timeout` seconds. Those shards are left out of the merge rather than failing the request,
+    unless no shard answered at all. A single shard has nothing to fall back on, so it is queried
+    directly without a timeout.
+    """
+    if len(shards) == 1:
+        return merge([(shards[0], _retrieve_shard(kendra, shards[0], query))], page_size), []
+
+    futures = [(_executor.submit(_retrieve_shard, kendra, shard, query), shard) for shard in shards]
+    done, _ = wait([future for future, _ in futures], timeout=timeout)
+
+    results: List[Tuple[Shard, List[Tuple[float, dict]]]] = []
+    failed: List[str] = []
+    for future, shard in futures:
+        if future in done and future.exception() is None:
+            results.append((shard, future.result()))
+        else:
+            failed.append(shard.name)
+
+    if not results:
+        first_future = futures[0][0]
+        if first_future in done and first_future.exception() is not None:
+            raise first_future.exception()  # type: ignore[misc]
+        raise TimeoutError(f"No retrieval shard answered within {timeout} seconds")
+
+    return merge(results, page_size), failed
@@ -0,0 +1,123 @@
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Claude's tokenizer is not available in the Lambda function. English text averages about four
+# characters per token; three leaves headroom for text that tokenizes less efficiently, such as code
+# and resource names.
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class InMemorySessionStore:
+    """Local stand-in for the session store, only kept for the life of the execution environment."""
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, dict] = {}
+
+    def get(self, session_id: str) -> Optional[dict]:
+        return self._sessions.get(session_id)
+
+    def put(self, session_id: str, state: dict) -> None:
+        self._sessions[session_id] = state
+
+
+class DynamoDBSessionStore:
+    """Keep session state in a DynamoDB table keyed by `session_id`, expiring idle sessions."""
+
+    def __init__(self, dynamodb: Any, table_name: str, ttl_seconds: int) -> None:
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, session_id: str) -> Optional[dict]:
+        item = self.dynamodb.get_item(
+            TableName=self.table_name,
+            Key={"session_id": {"S": session_id}},
+        ).get("Item")
+        if item is None or int(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["state"]["S"])
+
+    def put(self, session_id: str, state: dict) -> None:
+        self.dynamodb.put_item(
+            TableName=self.table_name,
+            Item={
+                "session_id": {"S": session_id},
+                "state": {"S": json.dumps(state)},
+                "expires_at": {"N": str(int(time.time()) + self.ttl_seconds)},
+            },
+        )
+
+
+class Conversation:
+    """The state of a multi-turn session: a rolling summary of older turns and the latest turns.
+
+    `summarize` and `rewrite` are callables backed by the LLM. `summarize(summary, turns)` folds
+    turns into the summary, and `rewrite(history, question)` turns a follow-up question into a
+    standalone query for retrieval.
+    """
+
+    def __init__(
+        self,
+        state: Optional[dict],
+        recent_turns: int,
+        token_budget: int,
+        summarize: Callable[[str, List[dict]], str],
+        rewrite: Callable[[str, str], str],
+    ) -> None:
+        state = state or {}
+        self.summary: str = state.get("summary", "")
+        self.turns: List[dict] = state.get("turns", [])
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self._summarize = summarize
+        self._rewrite = rewrite
+        self.standalone_question: Optional[str] = None
+
+    def to_state(self) -> dict:
+        return {"summary": self.summary, "turns": self.turns}
+
+    def render_history(self) -> str:
+        """Render the summary and the turns not folded into it yet, within the token budget.
+
+        Turns are kept newest first, since follow-up questions usually refer to them. The summary
+        gets the remaining budget and is truncated from its beginning.
+        """
+        if not self.summary and not self.turns:
+            return ""
+
+        budget = self.token_budget - estimate_tokens("<history>\n</history>\n\n")
+        turns: List[str] = []
+        for turn in reversed(self.turns):
+            rendered = f"User: {turn['question']}\nAssistant: {turn['answer']}\n"
+            if estimate_tokens(rendered) > budget:
+                break
+            turns.insert(0, rendered)
+            budget -= estimate_tokens(rendered)
+
+        prefix = "Summary of the earlier conversation: "
+        budget -= estimate_tokens(f"{prefix}\n")
+        summary = self.summary[-budget * CHARS_PER_TOKEN :] if budget > 0 else ""
+        sections = ([f"{prefix}{summary}\n"] if summary else []) + turns
+        return "<history>\n" + "".join(sections) + "</history>\n\n"
+
+    def rewrite_question(self, question: str) -> str:
+        """Return a standalone version of `question`, or the question itself on the first turn."""
+        history = self.render_history()
+        self.standalone_question = self._rewrite(history, question) if history else question
+        return self.standalone_question
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """Record a turn, compacting older turns into the summary once there are too many.
+
+        Compaction only runs when twice `recent_turns` turns are kept, so the summarization cost is
+        paid once every `recent_turns` turns rather than on every turn.
+        """
+        self.turns.append({"question": question, "answer": answer})
+        if len(self.turns) >= 2 * self.recent_turns:
+            older, self.turns = self.turns[: -self.recent_turns], self.turns[-self.recent_turns :]
+            self.summary = self._summarize(self.summary, older)
@@ -1,6 +1,12 @@
+import hashlib
+import importlib.util
+import json
 import os
 import platform
+import shutil
+import subprocess
 import tempfile
+import zipfile
 
 from invoke import task
 
@@ -37,6 +43,99 @@ def check(context):
     context.run(f"{PIPX_HOME}/venvs/flake8/bin/flake8 src")
 
 
+@task
+def train_classifier(context, data, output="src/koachang_mlu_course_llm_ops/off_topic_classifier.json", threshold=0.9):
+    """Train the off-topic pre-classifier from logged questions.
+
+    DATA is a JSON Lines file with `question` and `off_topic` fields. The rejection rates on a held-out
+    fifth of the data at THRESHOLD are printed so the threshold can be tuned against the cost of
+    wrongly rejected questions.
+    """
+    # Load the module from its file: importing the package would import the handler, which requires
+    # the Lambda function's environment.
+    spec = importlib.util.spec_from_file_location(
+        "classifier", os.path.join("src", "koachang_mlu_course_llm_ops", "classifier.py")
+    )
+    classifier_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(classifier_module)
+
+    examples = classifier_module.load_examples(data)
+    held_out = examples[::5]
+    classifier = classifier_module.train([example for i, example in enumerate(examples) if i % 5])
+    print(f"Held-out rejection rates: {classifier_module.evaluate(classifier, held_out, float(threshold))}")
+
+    classifier = classifier_module.train(examples)
+    classifier.save(output)
+    print(f"Saved {len(classifier.weights)} weights to {output}")
+
+
+@task(help={
+    "logs": "JSON Lines export of the service's logs. Only `Question received` entries are counted",
+    "guardrail_version": "Version of the guardrail deployed with the Lambda function",
+    "rag_version_file": "Version file of the corpus indexed by Kendra",
+    "force": "Rebuild even if the bank matches the current corpus version and prompt",
+})
+def build_answer_bank(
+    context,
+    logs,
+    guardrail_version,
+    top=300,
+    min_count=3,
+    rag_version_file="../KoachangMLUCourseLLMOpsData/public/rag_version.txt",
+    output="src/koachang_mlu_course_llm_ops/answer_bank.bin",
+    force=False,
+):
+    """Precompute the answers of the most frequent logged questions.
+
+    Answers are generated, guarded and linked by the live chain, so this task needs the environment of
+    the Lambda function (AWS_REGION, KENDRA_INDEX_ID and GUARDRAIL_ID) and AWS credentials. The
+    guardrail version is part of the bank's fingerprint, so it must be the deployed one, or the
+    Lambda function will not serve the bank. The bank is rebuilt only when the corpus version,
+    prompt, model or guardrail changed.
+    """
+    with open(rag_version_file) as f:
+        os.environ["RAG_VERSION"] = f.read().strip()
+    os.environ["GUARDRAIL_VERSION"] = str(guardrail_version)
+    from aws_lambda_powertools.event_handler.exceptions import BadRequestError
+    from koachang_mlu_course_llm_ops import answer_bank, handler
+
+    prompt_digest = hashlib.sha256(handler.prompt_enforce.template.encode("utf-8")).hexdigest()
+    print(
+        f"Fingerprint {handler.ANSWER_BANK_FINGERPRINT.hex()} of RAG version {handler.RAG_VERSION}, "
+        f"model {handler.MODEL_ID}, guardrail version {handler.GUARDRAIL_VERSION} "
+        f"and prompt {prompt_digest[:12]}"
+    )
+    if not force and os.path.exists(output):
+        if answer_bank.AnswerBank(output).fingerprint == handler.ANSWER_BANK_FINGERPRINT:
+            print(f"{output} is up to date")
+            return
+
+    # Other log entries, such as pre-classifier decisions, also carry the question. Only count each
+    # request once.
+    with open(logs) as f:
+        logged_questions = [
+            entry.get("question") or ""
+            for entry in map(json.loads, filter(str.strip, f))
+            if entry.get("message") == "Question received"
+        ]
+    frequent_questions = answer_bank.mine_frequent_questions(logged_questions, int(top), int(min_count))
+
+    entries = []
+    for question, count in frequent_questions:
+        try:
+            answer = handler.get_chain().invoke(question).strip()
+        except (BadRequestError, handler.OffTopicQuestionError) as e:
+            # Questions blocked by the guardrail or the pre-classifier are left to the live path.
+            print(f"Skipping {question!r} ({count} requests): {e}")
+            continue
+        document_ids = handler.retrieve_context(question)["document_ids"]
+        links = {handler.get_link_from_document_id(document_id) for document_id in document_ids}
+        entries.append((question, answer, [link for link in links if link]))
+
+    written = answer_bank.write_answer_bank(output, handler.ANSWER_BANK_FINGERPRINT, entries)
+    print(f"Wrote {written} answers to {output}")
+
+
 @task
 def copy_bats_publisher_configuration(context):
     """Copy the BATS publisher configuration to output directory.
@@ -47,23 +146,233 @@ def copy_bats_publisher_configuration(context):
     context.run(f"cp -a configuration/Packaging build")
 
 
-@task
-def make_archive(context):
-    """Create the Lambda zip file"""
+TARGET_PYTHON_VERSION = "3.11"
+
+# Files and directories that are never imported by the Lambda function. Documentation directories
+# are kept when they are Python packages, such as botocore.docs.
+STRIPPED_TEST_DIRECTORIES = {"tests", "test"}
+STRIPPED_DOC_DIRECTORIES = {"docs", "doc", "examples"}
+STRIPPED_SUFFIXES = (".pyi", ".md", ".rst", ".c", ".h", ".pyx", ".pxd")
+
+# botocore and boto3 ship API models for every AWS service. Only keep the ones the handler calls.
+BOTOCORE_SERVICES = {"bedrock-runtime", "dynamodb", "kendra", "sso", "sso-oidc", "sts"}
+
+# LangChain community integrations that are lazily imported and never used by the handler.
+UNUSED_SUBMODULES = [
+    "langchain_community/agent_toolkits",
+    "langchain_community/document_loaders",
+    "langchain_community/graphs",
+    "langchain_community/retrievers",
+    "langchain_community/vectorstores",
+]
+
+# Top-level entries of this package in the archive, including its `amzn_koachang_mlu_course_llm_ops`
+# dist-info, which stay in the function zip when dependencies are split into a layer.
+PACKAGE_ENTRY_PREFIXES = ("koachang_mlu_course_llm_ops", "amzn_koachang_mlu_course_llm_ops")
+
+# Fixed timestamp for zip entries so that identical inputs produce byte-identical artifacts.
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+
+
+def _strip_archive(archive_dir):
+    for root, dirs, files in os.walk(archive_dir, topdown=True):
+        for name in list(dirs):
+            path = os.path.join(root, name)
+            is_package = os.path.exists(os.path.join(path, "__init__.py"))
+            if (
+                name in STRIPPED_TEST_DIRECTORIES
+                or name == "__pycache__"
+                or (name in STRIPPED_DOC_DIRECTORIES and not is_package)
+            ):
+                shutil.rmtree(path)
+                dirs.remove(name)
+        for name in files:
+            if name.endswith(STRIPPED_SUFFIXES) or name.endswith((".pyc", ".pyo")):
+                os.remove(os.path.join(root, name))
+        # pip records the absolute path of local sources in direct_url.json, which would make the
+        # artifact depend on where the repository is checked out.
+        if root.endswith(".dist-info") and "direct_url.json" in files:
+            os.remove(os.path.join(root, "direct_url.json"))
+            record_path = os.path.join(root, "RECORD")
+            entry = f"{os.path.basename(root)}/direct_url.json,"
+            if os.path.exists(record_path):
+                with open(record_path) as f:
+                    record = [line for line in f if not line.startswith(entry)]
+                with open(record_path, "w") as f:
+                    f.writelines(record)
+
+    for data_dir in [os.path.join(archive_dir, "botocore", "data"), os.path.join(archive_dir, "boto3", "data")]:
+        if not os.path.isdir(data_dir):
+            continue
+        for name in os.listdir(data_dir):
+            path = os.path.join(data_dir, name)
+            if os.path.isdir(path) and name not in BOTOCORE_SERVICES:
+                shutil.rmtree(path)
+
+    for submodule in UNUSED_SUBMODULES:
+        shutil.rmtree(os.path.join(archive_dir, submodule), ignore_errors=True)
+
+
+def _target_environment(archive_dirs):
+    # The handler reads its configuration at import time, so import checks need placeholder values.
+    return {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(archive_dirs),
+        "AWS_REGION": "us-west-2",
+        "KENDRA_INDEX_ID": "artifact-import-check",
+        "GUARDRAIL_ID": "artifact-import-check",
+        "GUARDRAIL_VERSION": "1",
+    }
+
+
+def _compile_bytecode(context, target_interpreter, archive_dir, runtime_dir):
+    """Precompile bytecode, since the Lambda file system is read-only and cannot cache it at runtime.
+
+    Hash-based pycs that are not checked against their sources skip the stat calls of timestamp-based
+    pycs on import. Source paths are recorded as `runtime_dir`, where Lambda extracts the archive,
+    instead of the temporary build directory, which keeps the pycs reproducible.
+    """
+    context.run(
+        f"{target_interpreter} -m compileall -q -j 0 --invalidation-mode unchecked-hash "
+        f"-s {archive_dir} -p {runtime_dir} {archive_dir}"
+    )
+
+
+def _import_times(target_interpreter, archive_dirs):
+    """Return the time in microseconds spent importing each top-level package when loading the handler.
+
+    The self time of every module is attributed to its top-level package, so a dependency is not
+    charged for the packages it imports. The interpreter runs without site-packages, user site or
+    the working directory on its path, so a module stripped from the archive cannot be imported
+    from the build environment instead.
+    """
+    result = subprocess.run(
+        [
+            target_interpreter, "-S", "-s", "-P",
+            "-X", "importtime", "-c", "import koachang_mlu_course_llm_ops",
+        ],
+        env=_target_environment(archive_dirs),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.splitlines()[-1] if result.stderr else ""
+        raise RuntimeError(f"The handler cannot be imported from the stripped archive: {error}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, _, module = line[len("import time:"):].split("|")
+        top_level = module.strip().split(".")[0]
+        times[top_level] = times.get(top_level, 0) + int(self_time)
+    return times
+
+
+def _sizes(archive_dir):
+    """Return the installed size in bytes of each top-level entry of the archive directory."""
+    sizes = {}
+    for name in os.listdir(archive_dir):
+        path = os.path.join(archive_dir, name)
+        if os.path.isfile(path):
+            sizes[name] = os.path.getsize(path)
+            continue
+        sizes[name] = sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(path)
+            for file in files
+        )
+    return sizes
+
+
+def _write_zip(source_dir, output_location, prefix=""):
+    """Zip a directory reproducibly: sorted entries, fixed timestamps and permissions."""
+    if os.path.exists(output_location):
+        os.remove(output_location)
+    with zipfile.ZipFile(output_location, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        for root, dirs, files in os.walk(source_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                entry = zipfile.ZipInfo(
+                    os.path.join(prefix, os.path.relpath(path, source_dir)), date_time=ZIP_TIMESTAMP
+                )
+                entry.external_attr = 0o644 << 16
+                entry.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as f:
+                    archive.writestr(entry, f.read(), compresslevel=9)
+
+
+@task(help={
+    "layer": "Measure a split of third-party dependencies into a layer, in build/layer. Not deployable",
+    "skip_import_check": "Do not import the handler from the archive, e.g. on hosts other than Linux x86_64",
+})
+def make_archive(context, layer=False, skip_import_check=False):
+    """Create the Lambda zip file and a size and import-time report of its dependencies"""
 
     interpreter_version = ".".join(platform.python_version_tuple()[:2])
     interpreter = f"python{interpreter_version}"
+    target_interpreter = shutil.which(f"python{TARGET_PYTHON_VERSION}")
+    if not target_interpreter:
+        raise RuntimeError(
+            f"python{TARGET_PYTHON_VERSION} is required to precompile the archive's bytecode"
+        )
+    # The dependencies are built for Linux x86_64, so they can only be imported on such hosts.
+    if not skip_import_check and (platform.system(), platform.machine()) != ("Linux", "x86_64"):
+        raise RuntimeError(
+            "The handler can only be imported from the archive on Linux x86_64. "
+            "Pass --skip-import-check to build without checking it."
+        )
     archive_dir = tempfile.TemporaryDirectory()
-    context.run(f"{interpreter} -mpip install . --target {archive_dir.name} --platform manylinux2014_x86_64 --python-version 3.11 --only-binary=:all: --upgrade")
-    context.run(f"find {archive_dir.name} -name '*.so' -o -name '__pycache__' -o -name '__pycache__' -o -name '*.pyc' -delete")
+    context.run(f"{interpreter} -mpip install . --target {archive_dir.name} --platform manylinux2014_x86_64 --python-version {TARGET_PYTHON_VERSION} --only-binary=:all: --upgrade --no-compile --constraint requirements.txt")
+    _strip_archive(archive_dir.name)
 
-    output_location = os.path.abspath(
-        os.path.join(context.cwd, "build", f"Lambda.zip")
-    )
-    context.run(f"rm -f {output_location}")
+    report = {"python_version": TARGET_PYTHON_VERSION, "sizes": _sizes(archive_dir.name)}
+
+    build_dir = os.path.abspath(os.path.join(context.cwd, "build"))
+    if layer:
+        # The service stack does not attach a layer, so the function-only zip is kept out of the
+        # published build/Lambda.zip.
+        build_dir = os.path.join(build_dir, "layer")
+    os.makedirs(build_dir, exist_ok=True)
+    output_location = os.path.join(build_dir, "Lambda.zip")
+    # Each entry is (source directory, directory Lambda extracts it to, output zip, prefix in the zip).
+    artifacts = [(archive_dir.name, "/var/task", output_location, "")]
+    if layer:
+        # Lambda layers are extracted to /opt, and /opt/python is on the Python path.
+        function_dir = tempfile.TemporaryDirectory()
+        for name in os.listdir(archive_dir.name):
+            if name.startswith(PACKAGE_ENTRY_PREFIXES):
+                shutil.move(os.path.join(archive_dir.name, name), function_dir.name)
+        artifacts = [
+            (function_dir.name, "/var/task", output_location, ""),
+            (archive_dir.name, "/opt/python", os.path.join(build_dir, "Layer.zip"), "python"),
+        ]
+
+    for source_dir, runtime_dir, _, _ in artifacts:
+        _compile_bytecode(context, target_interpreter, source_dir, runtime_dir)
+    # Importing the handler also checks that stripping did not remove a module it needs.
+    if skip_import_check:
+        print("WARNING: The import check is skipped. The archive may miss modules the handler needs.")
+    else:
+        report["import_times_us"] = _import_times(
+            target_interpreter, [source_dir for source_dir, _, _, _ in artifacts]
+        )
+
+    for source_dir, _, zip_location, prefix in artifacts:
+        _write_zip(source_dir, zip_location, prefix)
+    report["artifact_size"] = os.path.getsize(output_location)
+    if layer:
+        report["layer_size"] = os.path.getsize(os.path.join(build_dir, "Layer.zip"))
+
+    with open(os.path.join(build_dir, "artifact-report.json"), "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
 
-    with context.cd(archive_dir.name):
-        context.run(f"zip -r {output_location} .")
+    import_times = report.get("import_times_us", {})
+    print(f"{'Dependency':<40}{'Size (KiB)':>12}{'Import (ms)':>14}")
+    for name, size in sorted(report["sizes"].items(), key=lambda item: item[1], reverse=True):
+        import_time = f"{import_times[name] / 1000:.1f}" if name in import_times else "-"
+        print(f"{name:<40}{size / 1024:>12.0f}{import_time:>14}")
+    print(f"Lambda.zip: {report['artifact_size'] / 1024:.0f} KiB")
 
 @task(pre=[make_archive, copy_bats_publisher_configuration])
 def compile(context):
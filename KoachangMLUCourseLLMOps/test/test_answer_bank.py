@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from koachang_mlu_course_llm_ops.answer_bank import (
+    AnswerBank,
+    fingerprint,
+    mine_frequent_questions,
+    normalize_question,
+    write_answer_bank,
+)
+
+
+@pytest.fixture
+def bank_path(tmp_path):
+    path = str(tmp_path / "answer_bank.bin")
+    write_answer_bank(
+        path,
+        fingerprint("1.1", "fake prompt"),
+        [
+            ("What architectures does Lambda support?", "x86_64 and arm64.", ["https://b", "https://a"]),
+            ("What is Amazon SageMaker?", "A machine learning service.", []),
+        ],
+    )
+    yield path
+
+
+def test_normalize_question():
+    assert normalize_question("  What  is\tLAMBDA?? ") == "what is lambda"
+    assert normalize_question("Ｗhat is Lambda") == "what is lambda"
+
+
+def test_mine_frequent_questions():
+    questions = ["What is Lambda?"] * 2 + ["what is lambda"] + ["What is SageMaker?"] * 2 + ["Other"]
+
+    assert mine_frequent_questions(questions, top=5, min_count=2) == [
+        ("What is Lambda?", 3),
+        ("What is SageMaker?", 2),
+    ]
+    assert mine_frequent_questions(questions, top=1, min_count=2) == [("What is Lambda?", 3)]
+
+
+def test_lookup_banked_question(bank_path):
+    bank = AnswerBank(bank_path)
+
+    assert len(bank) == 2
+    assert bank.fingerprint == fingerprint("1.1", "fake prompt")
+    assert bank.lookup("what architectures does lambda support") == {
+        "answer": "x86_64 and arm64.",
+        "relevant_links": ["https://a", "https://b"],
+    }
+    assert bank.lookup("What is Amazon SageMaker?")["answer"] == "A machine learning service."
+
+
+def test_lookup_unknown_question(bank_path):
+    bank = AnswerBank(bank_path)
+
+    assert bank.lookup("What is Amazon Kendra?") is None
+    assert bank.lookup("What architectures does Lambda not support?") is None
+
+
+def test_empty_bank(tmp_path):
+    path = str(tmp_path / "answer_bank.bin")
+
+    assert write_answer_bank(path, fingerprint("1.1"), []) == 0
+    assert AnswerBank(path).lookup("What is Lambda?") is None
+
+
+@pytest.mark.parametrize("content", [b"", b"not an answer bank", b"ANSBANK1"])
+def test_invalid_bank_is_rejected(tmp_path, content):
+    path = tmp_path / "answer_bank.bin"
+    path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        AnswerBank(str(path))
+
+
+def test_truncated_bank_is_rejected(bank_path):
+    with open(bank_path, "rb+") as f:
+        f.truncate(os.path.getsize(bank_path) - 1)
+
+    with pytest.raises(ValueError):
+        AnswerBank(bank_path)
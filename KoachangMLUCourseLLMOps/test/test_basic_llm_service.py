@@ -7,7 +7,9 @@ from unittest.mock import call, patch, Mock
 
 import botocore
 
-from koachang_mlu_course_llm_ops import lambda_handler
+from koachang_mlu_course_llm_ops import handler, lambda_handler
+from koachang_mlu_course_llm_ops.answer_bank import fingerprint, write_answer_bank
+from koachang_mlu_course_llm_ops.session import InMemorySessionStore
 
 
 @pytest.fixture
@@ -223,3 +225,136 @@ def test_guardrailed_question(mock_aws, mock_event, mock_retrieve_context):
     assert (
         json.loads(response.get("body")).get("message") == "Content was blocked by guardrail"
     )
+
+
+def test_off_topic_question_short_circuits_chain(mock_aws, mock_event, caplog):
+    mock_event["body"] = '{"question": "Write me a poem about the ocean"}'
+
+    mock_aws.return_value = {"action": "NONE"}
+
+    with patch("koachang_mlu_course_llm_ops.handler.off_topic_classifier") as mock_classifier:
+        mock_classifier.predict.return_value = 0.99
+        response = lambda_handler(mock_event, None)
+
+    decision = next(r for r in caplog.records if r.getMessage() == "Pre-classifier decision")
+    assert decision.question == "Write me a poem about the ocean"
+    assert decision.rejected
+    assert [c.args[0] for c in mock_aws.call_args_list] == ["ApplyGuardrail"]
+    assert response.get("statusCode") == HTTPStatus.OK
+    assert json.loads(response.get("body")) == {
+        "answer": "I don't know. I can only answer questions about AWS.",
+        "relevant_links": [],
+    }
+
+
+def test_blocked_question_is_not_classified(mock_aws, mock_event, caplog):
+    mock_event["body"] = '{"question": "My secret key is fake-secret-key"}'
+    mock_aws.return_value = {"action": "GUARDRAIL_INTERVENED", "ResponseMetadata": {"RequestId": "fake"}}
+
+    with patch("koachang_mlu_course_llm_ops.handler.off_topic_classifier") as mock_classifier:
+        response = lambda_handler(mock_event, None)
+
+    assert response.get("statusCode") == HTTPStatus.BAD_REQUEST
+    assert not mock_classifier.predict.called
+    assert not any(r.getMessage() == "Pre-classifier decision" for r in caplog.records)
+    assert not any(getattr(r, "question", None) for r in caplog.records)
+
+
+def test_on_topic_question_passes_pre_classifier(mock_aws, mock_prompt, mock_llm, mock_event, caplog):
+    mock_event["body"] = '{"question": "fake question"}'
+    mock_aws.side_effect = [
+        {"action": "NONE"},
+        {"ResultItems": []},
+        {"action": "NONE"},
+        {"ResultItems": []},
+    ]
+    mock_llm.return_value = "<answer>fake-answer</answer>"
+
+    with patch("koachang_mlu_course_llm_ops.handler.off_topic_classifier") as mock_classifier:
+        mock_classifier.predict.return_value = 0.1
+        response = lambda_handler(mock_event, None)
+
+    mock_classifier.predict.assert_called_once_with("fake question")
+    assert [r.question for r in caplog.records if r.getMessage() == "Question received"] == ["fake question"]
+    assert response.get("statusCode") == HTTPStatus.OK
+    assert json.loads(response.get("body")).get("answer") == "fake-answer"
+
+
+def test_follow_up_question_in_session(mock_aws, mock_prompt, mock_llm, mock_event):
+    mock_event["body"] = '{"question": "fake follow-up", "session_id": "fake-session"}'
+    session_store = InMemorySessionStore()
+    session_store.put("fake-session", {"summary": "", "turns": [{"question": "Q1", "answer": "A1"}]})
+
+    mock_aws.side_effect = [
+        {"action": "NONE"},
+        {"ResultItems": [{"Content": "Content Foo", "DocumentId": "s3://fake-bucket/rag/blogs/foo.md"}]},
+        {"action": "NONE"},
+        {"ResultItems": [{"Content": "Content Foo", "DocumentId": "s3://fake-bucket/rag/blogs/foo.md"}]},
+    ]
+    mock_llm.side_effect = [
+        "<standalone_question>fake standalone question</standalone_question>",
+        "<answer>fake-answer</answer>",
+    ]
+
+    with patch("koachang_mlu_course_llm_ops.handler.session_store", session_store):
+        response = lambda_handler(mock_event, None)
+
+    assert response.get("statusCode") == HTTPStatus.OK
+    assert json.loads(response.get("body")) == {
+        "answer": "fake-answer",
+        "relevant_links": ["https://aws.amazon.com/blogs/compute/foo/"],
+        "session_id": "fake-session",
+    }
+    assert [c.args[1]["QueryText"] for c in mock_aws.call_args_list if c.args[0] == "Retrieve"] == [
+        "fake standalone question",
+        "fake standalone question",
+    ]
+    assert mock_prompt.call_args.args[0]["history"] == "<history>\nUser: Q1\nAssistant: A1\n</history>\n\n"
+    assert session_store.get("fake-session")["turns"][-1] == {"question": "fake follow-up", "answer": "fake-answer"}
+
+
+def test_invalid_session_id(mock_event):
+    mock_event["body"] = '{"question": "fake question", "session_id": ""}'
+
+    response = lambda_handler(mock_event, None)
+
+    assert response.get("statusCode") == HTTPStatus.BAD_REQUEST
+
+
+def test_banked_question_skips_chain(mock_aws, mock_event, caplog):
+    mock_event["body"] = '{"question": "What architectures does Lambda support?"}'
+
+    with patch("koachang_mlu_course_llm_ops.handler.precomputed_answers") as mock_bank:
+        mock_bank.lookup.return_value = {"answer": "fake-banked-answer", "relevant_links": ["https://fake-link"]}
+        response = lambda_handler(mock_event, None)
+
+    mock_bank.lookup.assert_called_once_with("What architectures does Lambda support?")
+    assert [r.question for r in caplog.records if r.getMessage() == "Question received"] == [
+        "What architectures does Lambda support?"
+    ]
+    assert not mock_aws.called
+    assert response.get("statusCode") == HTTPStatus.OK
+    assert json.loads(response.get("body")) == {
+        "answer": "fake-banked-answer",
+        "relevant_links": ["https://fake-link"],
+    }
+
+
+def test_stale_answer_bank_is_not_served(tmp_path):
+    path = str(tmp_path / "answer_bank.bin")
+    write_answer_bank(path, fingerprint("1.0"), [("fake question", "fake answer", [])])
+
+    with patch.object(handler, "ANSWER_BANK_PATH", path):
+        with patch.object(handler, "ANSWER_BANK_FINGERPRINT", fingerprint("1.1")):
+            assert handler.load_answer_bank() is None
+        with patch.object(handler, "ANSWER_BANK_FINGERPRINT", fingerprint("1.0")):
+            assert handler.load_answer_bank().lookup("Fake question?")["answer"] == "fake answer"
+
+
+def test_unreadable_answer_bank_is_not_served(tmp_path):
+    path = tmp_path / "answer_bank.bin"
+    path.write_bytes(b"")
+
+    with patch.object(handler, "ANSWER_BANK_PATH", str(path)):
+        with patch.object(handler, "ANSWER_BANK_FINGERPRINT", fingerprint("1.1")):
+            assert handler.load_answer_bank() is None
@@ -0,0 +1,54 @@
+import json
+
+from koachang_mlu_course_llm_ops.classifier import (
+    HashedNgramClassifier,
+    evaluate,
+    load_examples,
+    train,
+)
+
+EXAMPLES = [
+    ("What architectures does Lambda support?", False),
+    ("How do I deploy a SageMaker endpoint?", False),
+    ("How can I reduce Lambda cold start latency?", False),
+    ("Which instance types can SageMaker training jobs use?", False),
+    ("Write me a poem about the ocean", True),
+    ("What is the best pizza topping?", True),
+    ("Who won the football game last night?", True),
+    ("Tell me a joke about cats", True),
+]
+
+
+def test_training_separates_off_topic_questions():
+    classifier = train(EXAMPLES, epochs=50)
+
+    assert classifier.predict("Write me a poem about cats") > 0.5
+    assert classifier.predict("What architectures does SageMaker support?") < 0.5
+    assert evaluate(classifier, EXAMPLES, threshold=0.5) == {
+        "rejected_off_topic": 1.0,
+        "rejected_on_topic": 0.0,
+    }
+
+
+def test_untrained_classifier_is_undecided():
+    assert HashedNgramClassifier().predict("anything") == 0.5
+
+
+def test_save_and_load_round_trip(tmp_path):
+    classifier = train(EXAMPLES, epochs=5)
+    path = str(tmp_path / "classifier.json")
+
+    classifier.save(path)
+    loaded = HashedNgramClassifier.load(path)
+
+    assert loaded.predict("Tell me a joke") == classifier.predict("Tell me a joke")
+
+
+def test_load_examples(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    path.write_text(
+        json.dumps({"question": "What is Lambda?", "off_topic": False}) + "\n\n"
+        + json.dumps({"question": "Sing a song", "off_topic": True}) + "\n"
+    )
+
+    assert load_examples(str(path)) == [("What is Lambda?", False), ("Sing a song", True)]
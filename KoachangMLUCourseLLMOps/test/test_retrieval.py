@@ -0,0 +1,116 @@
+import json
+import time
+
+import pytest
+
+from unittest.mock import Mock
+
+from koachang_mlu_course_llm_ops.retrieval import (
+    Shard,
+    client_config,
+    load_shards,
+    merge,
+    retrieve,
+)
+
+
+def _item(document_id, content, confidence="HIGH"):
+    return {
+        "DocumentId": document_id,
+        "Content": content,
+        "ScoreAttributes": {"ScoreConfidence": confidence},
+    }
+
+
+def test_load_shards_defaults_to_single_shard():
+    assert load_shards(None, "fake-index", 5) == [Shard(name="default", index_id="fake-index", page_size=5)]
+
+
+def test_load_shards_from_config():
+    config = json.dumps([
+        {"name": "lambda", "attribute_filter": {"EqualsTo": {"Key": "_category", "Value": {"StringValue": "lambda"}}}, "quota": 2},
+        {"name": "blogs", "index_id": "other-index", "page_size": 3},
+    ])
+
+    shards = load_shards(config, "fake-index", 5)
+
+    assert shards[0].index_id == "fake-index"
+    assert shards[0].quota == 2
+    assert shards[0].attribute_filter == {"EqualsTo": {"Key": "_category", "Value": {"StringValue": "lambda"}}}
+    assert shards[1] == Shard(name="blogs", index_id="other-index", page_size=3)
+
+
+def test_merge_honours_quotas_and_scores():
+    large = Shard(name="large", index_id="fake-index")
+    small = Shard(name="small", index_id="fake-index", quota=1)
+    results = [
+        (large, [(1.1, _item("a", "A")), (1.0, _item("b", "B")), (0.9, _item("c", "C"))]),
+        (small, [(0.3, _item("d", "D")), (0.2, _item("e", "E"))]),
+    ]
+
+    merged = merge(results, page_size=3)
+
+    assert [item["DocumentId"] for item in merged] == ["a", "b", "d"]
+
+
+def test_merge_deduplicates_passages():
+    shard = Shard(name="default", index_id="fake-index")
+    results = [(shard, [(1.0, _item("a", "A")), (0.5, _item("a", "A")), (0.4, _item("b", "B"))])]
+
+    assert [item["DocumentId"] for item in merge(results, page_size=5)] == ["a", "b"]
+
+
+def test_retrieve_skips_timed_out_shard():
+    fast = Shard(name="fast", index_id="fast-index", attribute_filter={"EqualsTo": {}})
+    slow = Shard(name="slow", index_id="slow-index")
+
+    def fake_retrieve(**request):
+        if request["IndexId"] == "slow-index":
+            time.sleep(1)
+        return {"ResultItems": [_item(request["IndexId"], "Content")]}
+
+    kendra = Mock()
+    kendra.retrieve.side_effect = fake_retrieve
+
+    documents, failed = retrieve(kendra, "fake question", [fast, slow], page_size=5, timeout=0.2)
+
+    assert [document["DocumentId"] for document in documents] == ["fast-index"]
+    assert failed == ["slow"]
+    requests = {c.kwargs["IndexId"]: c.kwargs for c in kendra.retrieve.call_args_list}
+    assert requests["fast-index"]["AttributeFilter"] == {"EqualsTo": {}}
+    assert "AttributeFilter" not in requests["slow-index"]
+
+
+def test_single_shard_is_not_timed_out():
+    def fake_retrieve(**request):
+        time.sleep(0.2)
+        return {"ResultItems": [_item(request["IndexId"], "Content")]}
+
+    kendra = Mock()
+    kendra.retrieve.side_effect = fake_retrieve
+
+    documents, failed = retrieve(kendra, "fake question", [Shard(name="default", index_id="fake-index")], 5, 0.05)
+
+    assert [document["DocumentId"] for document in documents] == ["fake-index"]
+    assert failed == []
+
+
+def test_client_config_bounds_fanned_out_calls():
+    shards = [Shard(name="a", index_id="a-index"), Shard(name="b", index_id="b-index")]
+
+    config = client_config(shards, 3)
+
+    assert client_config(shards[:1], 3) is None
+    assert (config.connect_timeout, config.read_timeout) == (3, 3)
+    assert config.retries == {"total_max_attempts": 1}
+
+
+def test_retrieve_raises_when_no_shard_answers():
+    kendra = Mock()
+    kendra.retrieve.side_effect = RuntimeError("Kendra is down")
+    shards = [Shard(name="a", index_id="a-index"), Shard(name="b", index_id="b-index")]
+
+    with pytest.raises(RuntimeError):
+        retrieve(kendra, "fake question", shards, 5, 1)
+    with pytest.raises(RuntimeError):
+        retrieve(kendra, "fake question", shards[:1], 5, 1)
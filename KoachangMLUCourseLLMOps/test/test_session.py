@@ -0,0 +1,113 @@
+import json
+
+from unittest.mock import Mock
+
+from koachang_mlu_course_llm_ops.session import (
+    Conversation,
+    DynamoDBSessionStore,
+    InMemorySessionStore,
+    estimate_tokens,
+)
+
+
+def _conversation(state=None, recent_turns=2, token_budget=1000, summarize=None, rewrite=None):
+    return Conversation(
+        state,
+        recent_turns=recent_turns,
+        token_budget=token_budget,
+        summarize=summarize or Mock(return_value="fake summary"),
+        rewrite=rewrite or Mock(return_value="fake standalone question"),
+    )
+
+
+def test_first_turn_has_no_history_and_is_not_rewritten():
+    rewrite = Mock()
+    conversation = _conversation(rewrite=rewrite)
+
+    assert conversation.render_history() == ""
+    assert conversation.rewrite_question("fake question") == "fake question"
+    assert not rewrite.called
+
+
+def test_follow_up_question_is_rewritten_with_history():
+    rewrite = Mock(return_value="fake standalone question")
+    conversation = _conversation({"summary": "", "turns": [{"question": "Q1", "answer": "A1"}]}, rewrite=rewrite)
+
+    assert conversation.rewrite_question("fake question") == "fake standalone question"
+    assert conversation.standalone_question == "fake standalone question"
+    rewrite.assert_called_once_with("<history>\nUser: Q1\nAssistant: A1\n</history>\n\n", "fake question")
+
+
+def test_older_turns_are_compacted_into_summary():
+    summarize = Mock(return_value="fake summary")
+    conversation = _conversation(recent_turns=2, summarize=summarize)
+
+    for i in range(4):
+        conversation.add_turn(f"Q{i}", f"A{i}")
+
+    summarize.assert_called_once_with("", [{"question": "Q0", "answer": "A0"}, {"question": "Q1", "answer": "A1"}])
+    assert conversation.to_state() == {
+        "summary": "fake summary",
+        "turns": [{"question": "Q2", "answer": "A2"}, {"question": "Q3", "answer": "A3"}],
+    }
+
+
+def test_turns_are_rendered_until_they_are_summarized():
+    summarize = Mock(return_value="fake summary")
+    conversation = _conversation(recent_turns=3, summarize=summarize)
+
+    for i in range(5):
+        conversation.add_turn(f"Q{i}", f"A{i}")
+        history = conversation.render_history()
+        assert all(f"User: Q{j}\n" in history for j in range(i + 1))
+
+    assert not summarize.called
+    conversation.add_turn("Q5", "A5")
+    history = conversation.render_history()
+    assert "Summary of the earlier conversation: fake summary" in history
+    assert all(f"User: Q{j}\n" in history for j in range(3, 6))
+
+
+def test_history_stays_within_token_budget():
+    turns = [{"question": f"Q{i}" + "Q" * 400, "answer": "A" * 400} for i in range(3)]
+    conversation = _conversation({"summary": "S" * 2000, "turns": turns}, recent_turns=3, token_budget=300)
+
+    history = conversation.render_history()
+
+    assert estimate_tokens(history) <= 300
+    assert "Q2" in history
+    assert "Q1" not in history and "Q0" not in history
+
+
+def test_latest_turn_is_kept_before_summary():
+    turns = [{"question": "Q" * 200, "answer": "A" * 1000}]
+    conversation = _conversation({"summary": "S" * 2800, "turns": turns}, recent_turns=3, token_budget=1000)
+
+    history = conversation.render_history()
+
+    assert estimate_tokens(history) <= 1000
+    assert "Q" * 200 + "\nAssistant: " + "A" * 1000 in history
+    assert history.index("Summary of the earlier conversation: S") < history.index("User: ")
+
+
+def test_in_memory_session_store():
+    store = InMemorySessionStore()
+    store.put("fake-session", {"summary": "fake summary", "turns": []})
+
+    assert store.get("fake-session") == {"summary": "fake summary", "turns": []}
+    assert store.get("other-session") is None
+
+
+def test_dynamodb_session_store():
+    dynamodb = Mock()
+    store = DynamoDBSessionStore(dynamodb, "fake-table", ttl_seconds=60)
+
+    store.put("fake-session", {"summary": "fake summary", "turns": []})
+    item = dynamodb.put_item.call_args.kwargs["Item"]
+    dynamodb.get_item.return_value = {"Item": item}
+
+    assert item["session_id"] == {"S": "fake-session"}
+    assert store.get("fake-session") == {"summary": "fake summary", "turns": []}
+
+    dynamodb.get_item.return_value = {"Item": {**item, "expires_at": {"N": "0"}}}
+    assert store.get("fake-session") is None
@@ -52,6 +52,7 @@ const serviceStack = new ServiceStack(app, `KoachangMLUCourseLLMOps-Service-${st
   isProd: false,
   enableGradualDeployment: false,
   kendraIndex: dataStack.kendraIndex,
+  ragVersion: dataStack.getDataSetVersion(),
 });
 
 const monitoringStack = new MonitoringStack(app, `KoachangMLUCourseLLMOps-Monitoring-${stageName}`, {
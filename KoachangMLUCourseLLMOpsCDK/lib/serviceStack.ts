@@ -31,6 +31,7 @@ import { CfnIndex } from 'aws-cdk-lib/aws-kendra';
 import { Effect, ManagedPolicy, PolicyStatement, Role, ServicePrincipal } from 'aws-cdk-lib/aws-iam';
 import { LogGroup, RetentionDays } from 'aws-cdk-lib/aws-logs';
 import { CfnGuardrail, CfnGuardrailVersion } from 'aws-cdk-lib/aws-bedrock';
+import { AttributeType, BillingMode, Table, TableEncryption } from 'aws-cdk-lib/aws-dynamodb';
 
 interface ServiceStackProps {
   readonly env: DeploymentEnvironment;
@@ -66,6 +67,14 @@ interface ServiceStackProps {
    * @default - false, instrumentation is disabled by default.
    */
   readonly enableInstrumentation?: boolean;
+
+  /**
+   * Version of the dataset indexed by Kendra. The Lambda function only serves precomputed answers
+   * that were generated against this version.
+   *
+   * @default - precomputed answers are not served.
+   */
+  readonly ragVersion?: string;
 }
 
 export class ServiceStack extends DeploymentStack {
@@ -126,6 +135,15 @@ export class ServiceStack extends DeploymentStack {
       guardrailIdentifier: guardrail.attrGuardrailArn,
     });
 
+    // Conversation state of multi-turn sessions. Idle sessions expire through the TTL attribute.
+    const sessionTable = new Table(this, 'SessionTable', {
+      partitionKey: { name: 'session_id', type: AttributeType.STRING },
+      billingMode: BillingMode.PAY_PER_REQUEST,
+      encryption: TableEncryption.AWS_MANAGED,
+      timeToLiveAttribute: 'expires_at',
+      removalPolicy: RemovalPolicy.DESTROY,
+    });
+
     this.lambdaFunction = new Function(this, 'KoachangMLUCourseLLMOps', {
       functionName: 'KoachangMLUCourseLLMOps',
       description: `Timestamp: ${new Date().toISOString()} `,
@@ -162,6 +180,8 @@ export class ServiceStack extends DeploymentStack {
         KENDRA_INDEX_ID: props.kendraIndex.attrId,
         GUARDRAIL_ID: guardrail.attrGuardrailId,
         GUARDRAIL_VERSION: guardrailVersion.attrVersion,
+        SESSION_TABLE_NAME: sessionTable.tableName,
+        ...(props.ragVersion ? { RAG_VERSION: props.ragVersion } : {}),
       },
       adotInstrumentation: props.enableInstrumentation
         ? {
@@ -171,6 +191,8 @@ export class ServiceStack extends DeploymentStack {
         : undefined,
     });
 
+    sessionTable.grantReadWriteData(this.lambdaFunction);
+
     this.lambdaFunctionAlias = new Alias(this, 'KoachangMLUCourseLLMOpsFunctionAlias', {
       aliasName: 'live',
       version: this.lambdaFunction.currentVersion,
@@ -250,6 +272,11 @@ export class ServiceStack extends DeploymentStack {
       exportName: 'KoachangMLUCourseLLMOps-ApiUrl',
       value: this.restApi.url,
     });
+
+    // Answer banks must be built against the deployed guardrail version to be served.
+    new CfnOutput(this, 'KoachangMLUCourseLLMOps-GuardrailVersion', {
+      value: guardrailVersion.attrVersion,
+    });
   }
 
   private addGradualDeployment(isProd: boolean) {
@@ -1,2 +1,4 @@
+from .embedding import EmbeddingStore
 from .model import Model
 from .scoring import cosine_similarity, rouge_score
+from .sweep import CompletionCache, SweepQuestion, run_sweep, summarize_sweep
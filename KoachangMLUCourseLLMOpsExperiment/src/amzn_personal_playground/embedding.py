@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .invocation import (
+    EMBEDDING_DIMENSION,
+    MAX_EMBEDDING_BATCH,
+    build_embedding_request,
+    invoke,
+    parse_embedding_response,
+)
+from .model import Model
+
+_DIGEST_SIZE = 32
+
+
+def content_key(model: Model, text: str) -> bytes:
+    """Return the key of a text's embedding: a SHA-256 digest of the model ID and the text."""
+    return hashlib.sha256(f"{model.value}\0{text}".encode("utf-8")).digest()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class EmbeddingStore:
+    """Content-addressed, on-disk store of the embeddings produced by one Bedrock model.
+
+    A store directory holds three files:
+      * `meta.json`: the model ID and vector dimension.
+      * `vectors.f32`: a row-major float32 matrix, memory-mapped for reads.
+      * `keys.bin`: the sidecar index, one `content_key` digest per matrix row.
+
+    Vectors are L2-normalized on insert so that cosine similarity is a plain dot product. Texts
+    already in the store are never sent to Bedrock again.
+    """
+
+    def __init__(self, path: str, model: Model) -> None:
+        self.path = path
+        self.model = model
+        self.dimension = EMBEDDING_DIMENSION[model]
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["model"] != model.value:
+                raise ValueError(f"Store at {path} holds embeddings of {meta['model']}, not {model.value}")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model": model.value, "dimension": self.dimension}, f)
+
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        data = b""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "rb") as f:
+                data = f.read()
+        vector_bytes = (
+            os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        )
+        # An interrupted append can leave unindexed trailing vectors or a partial digest behind.
+        # Only rows with both a complete key and a complete vector are kept, and both files are
+        # truncated to them so that later appends stay aligned.
+        row_count = min(len(data) // _DIGEST_SIZE, vector_bytes // (self.dimension * 4))
+        self._rows: Dict[bytes, int] = {}
+        for row in range(row_count):
+            self._rows[data[row * _DIGEST_SIZE : (row + 1) * _DIGEST_SIZE]] = row
+        if os.path.exists(self._keys_path):
+            os.truncate(self._keys_path, row_count * _DIGEST_SIZE)
+        if os.path.exists(self._vectors_path):
+            os.truncate(self._vectors_path, row_count * self.dimension * 4)
+        self._matrix: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, text: str) -> bool:
+        return content_key(self.model, text) in self._rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The normalized vectors of the store, memory-mapped read-only."""
+        if len(self) == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self._matrix is None or self._matrix.shape[0] != len(self):
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(len(self), self.dimension)
+            )
+        return self._matrix
+
+    def _append(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(_normalize(vectors), dtype=np.float32).tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.write(b"".join(keys))
+        for key in keys:
+            self._rows[key] = len(self._rows)
+
+    def _embed_batch(
+        self, client: Any, texts: Sequence[str], input_type: str = "search_document"
+    ) -> np.ndarray:
+        body = build_embedding_request(self.model, texts, input_type)
+        payload, _, _ = invoke(client, self.model, body)
+        return np.asarray(parse_embedding_response(self.model, payload), dtype=np.float32)
+
+    def embed(self, client: Any, texts: Sequence[str], max_workers: int = 4) -> np.ndarray:
+        """Return the matrix rows holding the embeddings of `texts`, embedding only missing texts.
+
+        Missing texts are deduplicated and sent in batches of the largest size the model accepts,
+        with up to `max_workers` requests in flight.
+        """
+        keys = [content_key(self.model, text) for text in texts]
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows:
+                missing.setdefault(key, text)
+
+        if missing:
+            missing_keys = list(missing)
+            batch_size = MAX_EMBEDDING_BATCH[self.model]
+            batches = [
+                missing_keys[i : i + batch_size] for i in range(0, len(missing_keys), batch_size)
+            ]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(
+                    lambda batch: self._embed_batch(client, [missing[key] for key in batch]),
+                    batches,
+                )
+                for batch, vectors in zip(batches, results):
+                    self._append(batch, vectors)
+
+        return np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def search(
+        self, query: np.ndarray, k: int = 10, chunk_rows: int = 65536
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the rows and cosine similarities of the `k` vectors closest to `query`.
+
+        The matrix is scanned `chunk_rows` rows at a time so memory stays bounded on stores with
+        millions of rows, keeping only the best `k` candidates of each chunk.
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        matrix = self.matrix
+        k = min(k, len(matrix))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidate_rows: List[np.ndarray] = []
+        candidate_scores: List[np.ndarray] = []
+        for start in range(0, len(matrix), chunk_rows):
+            scores = matrix[start : start + chunk_rows] @ query
+            top = np.argpartition(scores, -k)[-k:] if len(scores) > k else np.arange(len(scores))
+            candidate_rows.append(top + start)
+            candidate_scores.append(scores[top])
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        order = np.argsort(-scores)[:k]
+        return rows[order], scores[order]
+
+    def search_text(self, client: Any, text: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Embed `text` as a search query and return the `k` closest rows of the store."""
+        query = self._embed_batch(client, [text], input_type="search_query")[0]
+        return self.search(query, k)
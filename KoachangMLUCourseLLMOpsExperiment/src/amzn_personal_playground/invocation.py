@@ -0,0 +1,145 @@
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .model import Model
+
+EMBEDDING_MODELS = {
+    Model.AMAZON_TITAN_EMBED_TEXT,
+    Model.COHERE_EMBED_ENGLISH,
+    Model.COHERE_EMBED_MULTILINGUAL,
+}
+
+# Largest number of texts a single InvokeModel request accepts for each embedding model, and the
+# dimension of the vectors it returns.
+MAX_EMBEDDING_BATCH = {
+    Model.AMAZON_TITAN_EMBED_TEXT: 1,
+    Model.COHERE_EMBED_ENGLISH: 96,
+    Model.COHERE_EMBED_MULTILINGUAL: 96,
+}
+EMBEDDING_DIMENSION = {
+    Model.AMAZON_TITAN_EMBED_TEXT: 1536,
+    Model.COHERE_EMBED_ENGLISH: 1024,
+    Model.COHERE_EMBED_MULTILINGUAL: 1024,
+}
+
+# On-demand list prices in USD per 1,000 (input, output) tokens. Keep in sync with
+# https://aws.amazon.com/bedrock/pricing/ before relying on the estimates.
+PRICE_PER_1K_TOKENS: Dict[Model, Tuple[float, float]] = {
+    Model.AI21_JURASSIC_MID: (0.0125, 0.0125),
+    Model.AI21_JURASSIC_ULTRA: (0.0188, 0.0188),
+    Model.AMAZON_TITAN_TEXT_LITE: (0.00015, 0.0002),
+    Model.AMAZON_TITAN_TEXT_EXPRESS: (0.0002, 0.0006),
+    Model.AMAZON_TITAN_EMBED_TEXT: (0.0001, 0.0),
+    Model.ANTHROPIC_CLAUDE_2: (0.008, 0.024),
+    Model.ANTHROPIC_CLAUDE_INSTANT: (0.0008, 0.0024),
+    Model.ANTHROPIC_CLAUDE_3_HAIKU: (0.00025, 0.00125),
+    Model.ANTHROPIC_CLAUDE_3_SONNET: (0.003, 0.015),
+    Model.COHERE_COMMAND: (0.0015, 0.002),
+    Model.COHERE_COMMAND_LIGHT: (0.0003, 0.0006),
+    Model.COHERE_EMBED_ENGLISH: (0.0001, 0.0),
+    Model.COHERE_EMBED_MULTILINGUAL: (0.0001, 0.0),
+    Model.META_LLAMA2: (0.00075, 0.001),
+}
+
+
+def build_text_request(
+    model: Model, prompt: str, max_tokens: int, temperature: float, top_p: float
+) -> Dict[str, Any]:
+    """Build the provider-specific InvokeModel body for a single-turn text prompt."""
+    provider = model.value.split(".")[0]
+    if model in EMBEDDING_MODELS:
+        raise ValueError(f"{model.name} is an embedding model and does not generate text")
+    if model in (Model.ANTHROPIC_CLAUDE_3_HAIKU, Model.ANTHROPIC_CLAUDE_3_SONNET):
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+    if provider == "anthropic":
+        return {
+            "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
+            "max_tokens_to_sample": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+    if provider == "ai21":
+        return {"prompt": prompt, "maxTokens": max_tokens, "temperature": temperature, "topP": top_p}
+    if provider == "amazon":
+        return {
+            "inputText": prompt,
+            "textGenerationConfig": {
+                "maxTokenCount": max_tokens,
+                "temperature": temperature,
+                "topP": top_p,
+            },
+        }
+    if provider == "cohere":
+        return {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "p": top_p}
+    if provider == "meta":
+        return {"prompt": prompt, "max_gen_len": max_tokens, "temperature": temperature, "top_p": top_p}
+    raise ValueError(f"Unsupported model: {model.value}")
+
+
+def parse_text_response(model: Model, payload: Dict[str, Any]) -> str:
+    """Extract the generated text from a decoded InvokeModel response body."""
+    provider = model.value.split(".")[0]
+    if model in (Model.ANTHROPIC_CLAUDE_3_HAIKU, Model.ANTHROPIC_CLAUDE_3_SONNET):
+        return "".join(block["text"] for block in payload["content"] if block["type"] == "text")
+    if provider == "anthropic":
+        return payload["completion"]
+    if provider == "ai21":
+        return payload["completions"][0]["data"]["text"]
+    if provider == "amazon":
+        return payload["results"][0]["outputText"]
+    if provider == "cohere":
+        return payload["generations"][0]["text"]
+    if provider == "meta":
+        return payload["generation"]
+    raise ValueError(f"Unsupported model: {model.value}")
+
+
+def build_embedding_request(
+    model: Model, texts: Sequence[str], input_type: str = "search_document"
+) -> Dict[str, Any]:
+    """Build the provider-specific InvokeModel body to embed a batch of texts.
+
+    `input_type` is only used by Cohere models, which distinguish between documents stored for
+    search ("search_document") and the queries run against them ("search_query").
+    """
+    if model not in EMBEDDING_MODELS:
+        raise ValueError(f"{model.name} is not an embedding model")
+    if len(texts) > MAX_EMBEDDING_BATCH[model]:
+        raise ValueError(f"{model.name} accepts at most {MAX_EMBEDDING_BATCH[model]} texts per request")
+    if model == Model.AMAZON_TITAN_EMBED_TEXT:
+        return {"inputText": texts[0]}
+    return {"texts": list(texts), "input_type": input_type}
+
+
+def parse_embedding_response(model: Model, payload: Dict[str, Any]) -> List[List[float]]:
+    """Extract the embedding vectors from a decoded InvokeModel response body."""
+    if model == Model.AMAZON_TITAN_EMBED_TEXT:
+        return [payload["embedding"]]
+    return payload["embeddings"]
+
+
+def invoke(client: Any, model: Model, body: Dict[str, Any]) -> Tuple[Dict[str, Any], int, int]:
+    """Invoke a Bedrock model and return the decoded body with its (input, output) token counts.
+
+    Token counts are read from the response headers Bedrock attaches to every invocation, so they
+    are reported consistently regardless of the model provider.
+    """
+    response = client.invoke_model(body=json.dumps(body), modelId=model.value)
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    input_tokens = int(headers.get("x-amzn-bedrock-input-token-count", 0))
+    output_tokens = int(headers.get("x-amzn-bedrock-output-token-count", 0))
+    return json.loads(response.get("body").read()), input_tokens, output_tokens
+
+
+def estimate_cost(model: Model, input_tokens: int, output_tokens: int) -> float:
+    """Estimate the on-demand cost in USD of an invocation, or NaN if the model has no price."""
+    if model not in PRICE_PER_1K_TOKENS:
+        return float("nan")
+    input_price, output_price = PRICE_PER_1K_TOKENS[model]
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
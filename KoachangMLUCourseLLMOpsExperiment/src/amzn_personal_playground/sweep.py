@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import pandas as pd
+
+from .invocation import build_text_request, estimate_cost, invoke, parse_text_response
+from .model import Model
+from .scoring import cosine_similarity, rouge_score
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "amzn_personal_playground", "sweep")
+
+
+@dataclass(frozen=True)
+class SweepQuestion:
+    question: str
+    # Reference answer used for quality scores. Questions without one are still invoked, but
+    # their rows are left out of the score columns.
+    reference: Optional[str] = None
+    context: str = ""
+
+
+class RateLimiter:
+    """Cap the concurrency and request rate of the calls made to a single model."""
+
+    def __init__(self, max_concurrency: int, requests_per_second: float) -> None:
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._interval = 1.0 / requests_per_second
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def __enter__(self) -> "RateLimiter":
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._semaphore.release()
+
+
+class CompletionCache:
+    """Store raw completions on disk, keyed by a hash of the model ID and the request body.
+
+    The request body holds the prompt and every generation parameter, so any change to either
+    produces a new key while unchanged invocations are served from disk on the next sweep.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: Model, body: Mapping[str, Any]) -> str:
+        encoded = json.dumps({"model": model.value, "body": body}, sort_keys=True)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, entry: Mapping[str, Any]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a concurrent reader never sees a partial entry.
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+
+def _invoke_cached(
+    client: Any,
+    cache: CompletionCache,
+    limiter: RateLimiter,
+    model: Model,
+    body: Dict[str, Any],
+) -> Dict[str, Any]:
+    key = CompletionCache.key(model, body)
+    entry = cache.get(key)
+    if entry is not None:
+        return {**entry, "cached": True}
+
+    with limiter:
+        start = time.perf_counter()
+        payload, input_tokens, output_tokens = invoke(client, model, body)
+        latency = time.perf_counter() - start
+
+    entry = {
+        "completion": parse_text_response(model, payload),
+        "latency": latency,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+    }
+    cache.put(key, entry)
+    return {**entry, "cached": False}
+
+
+def _invoke_or_error(
+    client: Any,
+    cache: CompletionCache,
+    limiter: RateLimiter,
+    model: Model,
+    body: Dict[str, Any],
+) -> Dict[str, Any]:
+    # A throttled call or a model that is not enabled in the account should cost one row, not the
+    # whole sweep.
+    try:
+        return {**_invoke_cached(client, cache, limiter, model, body), "error": None}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def run_sweep(
+    client: Any,
+    questions: Iterable[SweepQuestion],
+    models: Iterable[Model],
+    prompts: Mapping[str, str],
+    max_tokens: int = 500,
+    temperature: float = 0.0,
+    top_p: float = 1.0,
+    max_concurrency: int = 4,
+    requests_per_second: Optional[Mapping[Model, float]] = None,
+    cache: Optional[CompletionCache] = None,
+) -> pd.DataFrame:
+    """Invoke every (model, prompt variant, question) combination and return one row per call.
+
+    Each prompt variant is a template formatted with the `question` and `context` fields of a
+    `SweepQuestion`. Calls run concurrently with at most `max_concurrency` in flight per model and,
+    optionally, a per-model request rate. Each model has its own workers, so a rate-limited model
+    does not hold back the others. Completions already in the cache are not re-invoked, so
+    re-running a sweep after adding a model only pays for the new model. Failed calls and failed
+    scoring are reported in the `error` column instead of stopping the sweep.
+    """
+    cache = cache or CompletionCache()
+    requests_per_second = requests_per_second or {}
+    questions = list(questions)
+    models = list(models)
+    limiters = {
+        model: RateLimiter(max_concurrency, requests_per_second.get(model, float("inf")))
+        for model in models
+    }
+
+    jobs = []
+    for model in models:
+        for variant, template in prompts.items():
+            for item in questions:
+                prompt = template.format(question=item.question, context=item.context)
+                body = build_text_request(model, prompt, max_tokens, temperature, top_p)
+                jobs.append((model, variant, item, body))
+
+    with ExitStack() as stack:
+        executors = {
+            model: stack.enter_context(ThreadPoolExecutor(max_workers=max(1, max_concurrency)))
+            for model in models
+        }
+        futures: List[Future] = [
+            executors[model].submit(_invoke_or_error, client, cache, limiters[model], model, body)
+            for model, _, _, body in jobs
+        ]
+        results = [future.result() for future in futures]
+
+    rows: List[Dict[str, Any]] = []
+    for (model, variant, item, _), result in zip(jobs, results):
+        row: Dict[str, Any] = {
+            "model": model.name,
+            "prompt": variant,
+            "question": item.question,
+            "completion": None,
+            "cosine_similarity": float("nan"),
+            "rougeL": float("nan"),
+            "latency": float("nan"),
+            "input_tokens": float("nan"),
+            "output_tokens": float("nan"),
+            "cost": float("nan"),
+            "cached": False,
+            "error": result["error"],
+        }
+        if result["error"] is None:
+            completion = result["completion"]
+            if item.reference is not None and completion.strip() != "":
+                # Scoring can fail on some texts, e.g. completions made only of stopwords or missing
+                # NLTK data. The invocation is already paid for, so keep the row without scores.
+                try:
+                    row["cosine_similarity"] = cosine_similarity(completion, item.reference)
+                    row["rougeL"] = rouge_score("rougeL", item.reference, completion)
+                except Exception as e:
+                    row["cosine_similarity"] = row["rougeL"] = float("nan")
+                    row["error"] = f"Scoring failed: {type(e).__name__}: {e}"
+            row.update(
+                completion=completion,
+                latency=result["latency"],
+                input_tokens=result["input_tokens"],
+                output_tokens=result["output_tokens"],
+                cost=estimate_cost(model, result["input_tokens"], result["output_tokens"]),
+                cached=result["cached"],
+            )
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def summarize_sweep(rows: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate the rows returned by `run_sweep` into one line per (model, prompt variant)."""
+    grouped = rows.groupby(["model", "prompt"])
+    return pd.DataFrame(
+        {
+            "cosine_similarity": grouped["cosine_similarity"].mean(),
+            "rougeL": grouped["rougeL"].mean(),
+            "latency_p50": grouped["latency"].quantile(0.5),
+            "latency_p90": grouped["latency"].quantile(0.9),
+            "latency_p99": grouped["latency"].quantile(0.99),
+            "input_tokens": grouped["input_tokens"].sum(),
+            "output_tokens": grouped["output_tokens"].sum(),
+            "cost": grouped["cost"].sum(min_count=1),
+            "cache_hits": grouped["cached"].sum(),
+            "errors": grouped["error"].count(),
+        }
+    ).reset_index()
@@ -2,3 +2,7 @@ from invoke import task
 @task()
 def release(context):
     pass
+
+@task()
+def test(context):
+    context.run("pytest")
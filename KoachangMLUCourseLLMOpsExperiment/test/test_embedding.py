@@ -0,0 +1,109 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+from amzn_personal_playground.embedding import EmbeddingStore
+from amzn_personal_playground.model import Model
+
+
+def _vector(text, dimension):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).tolist()
+
+
+class FakeBedrockRuntime:
+    def __init__(self):
+        self.requests = []
+
+    def invoke_model(self, body, modelId):
+        request = json.loads(body)
+        self.requests.append(request)
+        if modelId == Model.AMAZON_TITAN_EMBED_TEXT.value:
+            payload = {"embedding": _vector(request["inputText"], 1536)}
+        else:
+            payload = {"embeddings": [_vector(text, 1024) for text in request["texts"]]}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+@pytest.fixture
+def client():
+    yield FakeBedrockRuntime()
+
+
+def test_embed_deduplicates_and_survives_reopen(tmp_path, client):
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+
+    rows = store.embed(client, ["a", "b", "a"])
+    assert rows.tolist() == [0, 1, 0]
+    assert client.requests == [{"texts": ["a", "b"], "input_type": "search_document"}]
+
+    reopened = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+    assert len(reopened) == 2
+    assert reopened.embed(client, ["b", "c"]).tolist() == [1, 2]
+    assert client.requests[-1]["texts"] == ["c"]
+    np.testing.assert_allclose(np.linalg.norm(reopened.matrix, axis=1), 1.0, rtol=1e-5)
+
+
+def test_embed_splits_batches(tmp_path, client):
+    cohere = EmbeddingStore(str(tmp_path / "cohere"), Model.COHERE_EMBED_ENGLISH)
+    titan = EmbeddingStore(str(tmp_path / "titan"), Model.AMAZON_TITAN_EMBED_TEXT)
+
+    cohere.embed(client, [f"text {i}" for i in range(200)])
+    assert sorted(len(request["texts"]) for request in client.requests) == [8, 96, 96]
+
+    client.requests.clear()
+    titan.embed(client, ["x", "y", "z"])
+    assert len(client.requests) == 3
+
+
+def test_store_rejects_other_model(tmp_path):
+    EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_MULTILINGUAL)
+
+
+def test_chunked_search_matches_brute_force(tmp_path, client):
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+    store.embed(client, [f"text {i}" for i in range(300)])
+    query = np.asarray(_vector("query", 1024), dtype=np.float32)
+
+    rows, scores = store.search(query, k=7, chunk_rows=16)
+
+    expected = np.argsort(-(store.matrix @ (query / np.linalg.norm(query))))[:7]
+    assert rows.tolist() == expected.tolist()
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_torn_writes_are_recovered(tmp_path, client):
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+    store.embed(client, ["a", "b"])
+    with open(tmp_path / "keys.bin", "ab") as f:
+        f.write(b"\0\0")
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.zeros(1024 + 3, dtype=np.float32).tobytes())
+
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+    store.embed(client, ["new"])
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+
+    assert "new" in store
+    assert store.embed(client, ["a", "b", "new"]).tolist() == [0, 1, 2]
+    assert os.path.getsize(tmp_path / "keys.bin") == 3 * 32
+    assert os.path.getsize(tmp_path / "vectors.f32") == 3 * 1024 * 4
+
+
+def test_keys_without_vectors_are_dropped(tmp_path, client):
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+    store.embed(client, ["a", "b"])
+    os.truncate(tmp_path / "vectors.f32", 1024 * 4 + 10)
+
+    store = EmbeddingStore(str(tmp_path), Model.COHERE_EMBED_ENGLISH)
+
+    assert len(store) == 1
+    assert "a" in store and "b" not in store
+    assert os.path.getsize(tmp_path / "keys.bin") == 32
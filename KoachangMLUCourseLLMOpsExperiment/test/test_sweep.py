@@ -0,0 +1,175 @@
+import io
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from unittest.mock import patch
+
+from amzn_personal_playground.model import Model
+from amzn_personal_playground.sweep import (
+    CompletionCache,
+    RateLimiter,
+    SweepQuestion,
+    run_sweep,
+    summarize_sweep,
+)
+
+PAYLOADS = {
+    Model.ANTHROPIC_CLAUDE_2: {"completion": "fake claude answer"},
+    Model.COHERE_COMMAND_LIGHT: {"generations": [{"text": "fake cohere answer"}]},
+}
+
+
+class FakeBedrockRuntime:
+    def __init__(self, failing_models=()):
+        self.failing_models = {model.value for model in failing_models}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def invoke_model(self, body, modelId):
+        with self._lock:
+            self.calls.append((modelId, time.monotonic()))
+        if modelId in self.failing_models:
+            raise RuntimeError("Model is not enabled")
+        return {
+            "ResponseMetadata": {
+                "HTTPHeaders": {
+                    "x-amzn-bedrock-input-token-count": "10",
+                    "x-amzn-bedrock-output-token-count": "5",
+                }
+            },
+            "body": io.BytesIO(json.dumps(PAYLOADS[Model(modelId)]).encode("utf-8")),
+        }
+
+
+@pytest.fixture
+def cache(tmp_path):
+    yield CompletionCache(str(tmp_path))
+
+
+def _questions(count):
+    return [SweepQuestion(f"fake question {i}") for i in range(count)]
+
+
+def test_cache_key_covers_model_and_body():
+    body = {"prompt": "fake prompt", "temperature": 0.0}
+
+    assert CompletionCache.key(Model.ANTHROPIC_CLAUDE_2, body) == CompletionCache.key(
+        Model.ANTHROPIC_CLAUDE_2, dict(reversed(body.items()))
+    )
+    assert CompletionCache.key(Model.ANTHROPIC_CLAUDE_2, body) != CompletionCache.key(
+        Model.ANTHROPIC_CLAUDE_INSTANT, body
+    )
+    assert CompletionCache.key(Model.ANTHROPIC_CLAUDE_2, body) != CompletionCache.key(
+        Model.ANTHROPIC_CLAUDE_2, {**body, "temperature": 0.5}
+    )
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(max_concurrency=4, requests_per_second=20)
+    start = time.monotonic()
+
+    for _ in range(5):
+        with limiter:
+            pass
+
+    assert time.monotonic() - start >= 0.2
+
+
+def test_rate_limited_model_does_not_block_others(cache):
+    client = FakeBedrockRuntime()
+    start = time.monotonic()
+
+    rows = run_sweep(
+        client,
+        _questions(10),
+        [Model.ANTHROPIC_CLAUDE_2, Model.COHERE_COMMAND_LIGHT],
+        {"plain": "{question}"},
+        max_concurrency=2,
+        requests_per_second={Model.ANTHROPIC_CLAUDE_2: 5.0},
+        cache=cache,
+    )
+
+    cohere_calls = [at for model, at in client.calls if model == Model.COHERE_COMMAND_LIGHT.value]
+    assert max(cohere_calls) - start < 0.5
+    assert len(rows) == 20
+    assert rows["error"].isna().all()
+
+
+def test_failed_calls_are_reported_per_row(cache):
+    client = FakeBedrockRuntime(failing_models=[Model.COHERE_COMMAND_LIGHT])
+
+    rows = run_sweep(
+        client,
+        _questions(2),
+        [Model.ANTHROPIC_CLAUDE_2, Model.COHERE_COMMAND_LIGHT],
+        {"plain": "{question}"},
+        cache=cache,
+    )
+
+    claude = rows[rows["model"] == "ANTHROPIC_CLAUDE_2"]
+    cohere = rows[rows["model"] == "COHERE_COMMAND_LIGHT"]
+    assert (claude["completion"] == "fake claude answer").all()
+    assert claude["error"].isna().all()
+    assert (cohere["error"] == "RuntimeError: Model is not enabled").all()
+    assert cohere["latency"].isna().all()
+
+
+def test_failed_scoring_keeps_the_row(cache):
+    client = FakeBedrockRuntime()
+    questions = [SweepQuestion("fake question", reference="fake reference")]
+
+    with patch(
+        "amzn_personal_playground.sweep.cosine_similarity", side_effect=ZeroDivisionError("division by zero")
+    ):
+        rows = run_sweep(client, questions, [Model.ANTHROPIC_CLAUDE_2], {"plain": "{question}"}, cache=cache)
+
+    row = rows.iloc[0]
+    assert row["completion"] == "fake claude answer"
+    assert row["input_tokens"] == 10
+    assert pd.isna(row["cosine_similarity"]) and pd.isna(row["rougeL"])
+    assert row["error"] == "Scoring failed: ZeroDivisionError: division by zero"
+
+
+def test_cached_completions_are_not_reinvoked(cache):
+    client = FakeBedrockRuntime()
+    arguments = (_questions(2), [Model.ANTHROPIC_CLAUDE_2], {"plain": "{question}"})
+
+    run_sweep(client, *arguments, cache=cache)
+    rows = run_sweep(client, *arguments, cache=cache)
+
+    assert len(client.calls) == 2
+    assert rows["cached"].all()
+    assert (rows["completion"] == "fake claude answer").all()
+
+
+def test_summarize_sweep():
+    nan = float("nan")
+    rows = pd.DataFrame(
+        {
+            "model": ["A", "A", "A", "B"],
+            "prompt": ["plain"] * 4,
+            "cosine_similarity": [0.5, 1.0, nan, nan],
+            "rougeL": [0.2, 0.4, nan, nan],
+            "latency": [1.0, 2.0, nan, 3.0],
+            "input_tokens": [10, 20, nan, 5],
+            "output_tokens": [1, 2, nan, 3],
+            "cost": [0.1, 0.2, nan, nan],
+            "cached": [True, False, False, False],
+            "error": [None, None, "RuntimeError: throttled", None],
+        }
+    )
+
+    summary = summarize_sweep(rows).set_index("model")
+
+    assert summary.loc["A", "cosine_similarity"] == 0.75
+    assert summary.loc["A", "latency_p50"] == 1.5
+    assert summary.loc["A", "input_tokens"] == 30
+    assert summary.loc["A", "cost"] == pytest.approx(0.3)
+    assert summary.loc["A", "cache_hits"] == 1
+    assert summary.loc["A", "errors"] == 1
+    assert pd.isna(summary.loc["B", "cost"])
+    assert summary.loc["B", "errors"] == 0